@@ -1,9 +1,26 @@
-from flask import Flask,make_response,jsonify,request
-from models import db, Product, Category, CartItem, WishlistItem
+import os
+from flask import Flask,make_response,jsonify,request,Response
+from models import db, Product, Category, CartItem, WishlistItem, product_category, category_closure, product_recommendations, include_object
 from flask_migrate import Migrate
 from flask_restful import Api,Resource
 from flask_cors import CORS
-from werkzeug.exceptions import NotFound, InternalServerError,BadRequest
+from sqlalchemy import inspect as sql_inspect, func, collate
+from sqlalchemy.orm import selectinload, load_only
+from werkzeug.exceptions import NotFound, InternalServerError,BadRequest, Conflict
+from pagination import parse_limit, keyset_page, iter_pages, MAX_PAGE_SIZE
+from cache import response_cache, VersionCounter, FragmentCache
+from streaming import stream_listing, STREAM_BATCH_SIZE
+from serializers import parse_fields, restrict_rules
+import search
+import facets
+from slugs import SlugMap
+from suggest import suggest_index
+import recommendations
+import shoppers
+import carts
+import stock
+from shoppers import current_session_id
+from related import category_bitsets, MAX_RELATED
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///electronics.db'   
@@ -11,55 +28,379 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.json.compact = False
 db.init_app(app)
 api = Api(app)
-migrate = Migrate(app, db)
-cors= CORS(app)
+migrate = Migrate(app, db, include_object=include_object)
+cors= CORS(app, expose_headers=[shoppers.SESSION_HEADER])
+response_cache.init_app(app)
+shoppers.init_app(app)
+
+# Tables behind the cached catalog responses; a commit touching any of them evicts those responses
+CATALOG_TABLES = ('products', 'categories', 'product_category', 'category_closure')
+catalog_version = VersionCounter(*CATALOG_TABLES)
+
+# slug -> id, so /products/<slug> and /categories/<slug> cost the same as id URLs
+product_slugs = SlugMap(Product)
+category_slugs = SlugMap(Category)
+
+# Products embed their categories flat; categories are loaded for a whole page in one IN query
+PRODUCT_RULES = ('-cart_items','-wishlist_items','categories','-categories.products')
+
+# Keys accepted by ?fields= (sparse fieldsets); only the matching columns are fetched
+PRODUCT_FIELDS = tuple(sql_inspect(Product).column_attrs.keys()) + ('categories',)
+CATEGORY_FIELDS = tuple(sql_inspect(Category).column_attrs.keys()) + ('product_count',)
+# Categories are listed without their members, those are paged from /categories/<id>/products
+CATEGORY_RULES = ('-products',)
+
+def load_fields(model, fields, relationships=()):
+    """Loader options that fetch only the requested columns and relationships of `model`."""
+    if fields is None:
+        return [selectinload(getattr(model, key)) for key in relationships]
+    columns = [getattr(model, key) for key in fields if key in sql_inspect(model).column_attrs]
+    options = [load_only(*(columns or [model.id]))]
+    options += [selectinload(getattr(model, key)) for key in relationships if key in fields]
+    return options
+
+# ?sort= values -> (keyset columns ending in the unique id, descending?); every one has a
+# matching (column, id) index, so a page is an index range walk that stops after `limit` rows
+_NAME_NOCASE = collate(Product.name, 'NOCASE').label('name')
+PRODUCT_SORTS = {
+    'id': ([Product.id], False),
+    'price': ([Product.price, Product.id], False),
+    '-price': ([Product.price, Product.id], True),
+    'name': ([_NAME_NOCASE, Product.id], False),
+    '-name': ([_NAME_NOCASE, Product.id], True),
+    'created': ([Product.created_at, Product.id], False),
+    '-created': ([Product.created_at, Product.id], True),
+}
+
+def parse_sort(args):
+    sort = args.get('sort', 'id')
+    if sort not in PRODUCT_SORTS:
+        raise BadRequest(f"sort must be one of: {', '.join(PRODUCT_SORTS)}")
+    return PRODUCT_SORTS[sort]
+
+# Encoded product JSON, re-built only when the product or its category links change
+product_fragments = FragmentCache('products', links={'product_category': 0}, dependencies=('categories',))
+
+def listing_response(fragments, next_cursor, **extra):
+    """{"products": [...], "next_cursor": ..., **extra} with the product fragments spliced in as-is."""
+    body = '{"products": [%s], "next_cursor": %s' % (','.join(fragments), app.json.dumps(next_cursor))
+    for key, value in extra.items():
+        body += ', "%s": %s' % (key, app.json.dumps(value, separators=(',', ':')))
+    return Response(body + '}', status=200, mimetype='application/json')
+
+def encode_products(product_ids, fields=None):
+    """JSON fragments for the given product ids, in order; ids with no product are skipped."""
+    found = fragments_by_id(product_ids, fields)
+    return [found[product_id] for product_id in product_ids if product_id in found]
+
+def fragments_by_id(product_ids, fields=None):
+    """{id: JSON fragment} for the products that exist; only rows missing from the fragment cache are loaded."""
+    found, versions = product_fragments.get_many(product_ids, fields or 'full')
+    if versions:
+        products = Product.query.options(*load_fields(Product, fields, ['categories'])).filter(Product.id.in_(list(versions)))
+        for product in products:
+            data = product.to_dict(only = fields or (), rules = restrict_rules(PRODUCT_RULES, fields))
+            fragment = app.json.dumps(data, separators=(',', ':'))
+            product_fragments.put(product.id, versions[product.id], fields or 'full', fragment)
+            found[product.id] = fragment
+    return found
+
+def parse_ids(raw, maximum=MAX_PAGE_SIZE):
+    """?ids=3,1,2 as a de-duplicated list of ints in request order."""
+    try:
+        ids = [int(part) for part in raw.split(',') if part.strip()]
+    except ValueError:
+        raise BadRequest("ids must be a comma-separated list of integers")
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise BadRequest("ids must name at least one product")
+    if len(ids) > maximum:
+        raise BadRequest(f"At most {maximum} ids can be fetched at once")
+    return ids
 
 # Product resource for all and one product
 class ProductResource(Resource):
-    def get(self, id=None):
+    @catalog_version.conditional
+    @response_cache.cached(*CATALOG_TABLES)
+    def get(self, id=None, slug=None):
         try:
+            fields = parse_fields(request.args.get('fields'), PRODUCT_FIELDS)
+            if slug is not None:
+                id = product_slugs.resolve(slug)
+                if id is None:
+                    raise NotFound("Product not found")
             if id:
                 # Getting single product
-                product = Product.query.get(id)
-                if not product:
+                fragments = encode_products([id], fields)
+                if not fragments:
                     raise NotFound("Product not found")
-                return make_response(product.to_dict(rules = ('-cart_items','-wishlist_items','categories')), 200)
+                return Response(fragments[0], status=200, mimetype='application/json')
+            if request.args.get('ids') is not None:
+                # Multi-get: one IN query for the uncached rows, results in request order
+                ids = parse_ids(request.args['ids'])
+                found = fragments_by_id(ids, fields)
+                return listing_response(
+                    [found[product_id] for product_id in ids if product_id in found], None,
+                    missing=[product_id for product_id in ids if product_id not in found],
+                )
+            filters = facets.parse_filters(request.args)
+            columns, descending = parse_sort(request.args)
+            query = facets.apply_filters(db.session.query(*columns), filters)
+            if request.args.get('stream'):
+                # Whole (filtered) catalog as a chunked JSON document, rows fetched one keyset batch at a time
+                return stream_listing(
+                    'products',
+                    iter_pages(query, columns, STREAM_BATCH_SIZE, descending=descending),
+                    lambda rows: encode_products([row.id for row in rows], fields),
+                )
             else:
-                # Getting all products
-                products = Product.query.all()
-                return make_response([product.to_dict(rules = ('-cart_items','-wishlist_items','categories')) for product in products], 200)
+                # Getting one page of products, ?limit= and ?cursor= seek by (?sort= key, id)
+                cursor = request.args.get('cursor')
+                rows, next_cursor = keyset_page(
+                    query, columns, cursor=cursor, limit=parse_limit(request.args), descending=descending,
+                )
+                fragments = encode_products([row.id for row in rows], fields)
+                if cursor:
+                    return listing_response(fragments, next_cursor)
+                # Facet counts don't change from page to page, they only come with the first one
+                return listing_response(fragments, next_cursor, facets=facets.facet_counts(db.session, filters))
                 
         except NotFound as e:
             return make_response({"error": str(e)}, 404)
+        except BadRequest as e:
+            return make_response({"error": e.description}, 400)
+        except Exception as e:
+            return make_response({"error": "Internal server error"}, 500)
+
+api.add_resource(ProductResource, '/products','/products/<int:id>','/products/<string:slug>')
+
+# Full-text product search over name and description, bm25-ranked and keyset-paginated
+class ProductSearchResource(Resource):
+    @catalog_version.conditional
+    @response_cache.cached(*CATALOG_TABLES)
+    def get(self):
+        try:
+            fields = parse_fields(request.args.get('fields'), PRODUCT_FIELDS)
+            product_ids, next_cursor = search.search_product_ids(
+                db.session, request.args.get('q'),
+                cursor=request.args.get('cursor'),
+                limit=parse_limit(request.args, default=20),
+            )
+            return listing_response(encode_products(product_ids, fields), next_cursor)
+        except BadRequest as e:
+            return make_response({"error": e.description}, 400)
+        except Exception as e:
+            return make_response({"error": "Internal server error"}, 500)
+
+api.add_resource(ProductSearchResource, '/products/search')
+
+class ProductSuggestResource(Resource):
+    def get(self):
+        try:
+            prefix = request.args.get('prefix', '')
+            if not prefix.strip():
+                raise BadRequest("prefix is required")
+            limit = parse_limit(request.args, default=10, maximum=50)
+            return make_response({"suggestions": suggest_index.suggest(db.session, prefix, limit)}, 200)
+        except BadRequest as e:
+            return make_response({"error": e.description}, 400)
+        except Exception as e:
+            return make_response({"error": "Internal server error"}, 500)
+
+api.add_resource(ProductSuggestResource, '/products/suggest')
+
+# "Frequently added together", precomputed by recommendations.rebuild()
+class ProductRecommendationsResource(Resource):
+    @response_cache.cached(*CATALOG_TABLES, product_recommendations.name)
+    def get(self, id):
+        try:
+            fields = parse_fields(request.args.get('fields'), PRODUCT_FIELDS)
+            limit = parse_limit(request.args, default=10, maximum=recommendations.TOP_K)
+            product_ids = recommendations.recommended_ids(db.session, id, limit)
+            if not product_ids and db.session.query(Product.id).filter_by(id=id).first() is None:
+                raise NotFound("Product not found")
+            return listing_response(encode_products(product_ids, fields), None)
+        except NotFound as e:
+            return make_response({"error": str(e)}, 404)
+        except BadRequest as e:
+            return make_response({"error": e.description}, 400)
+        except Exception as e:
+            return make_response({"error": "Internal server error"}, 500)
+
+api.add_resource(ProductRecommendationsResource, '/products/<int:id>/recommendations')
+
+# Products with the most similar category sets (Jaccard over category bitsets)
+class RelatedProductsResource(Resource):
+    @catalog_version.conditional
+    @response_cache.cached(*CATALOG_TABLES)
+    def get(self, id):
+        try:
+            fields = parse_fields(request.args.get('fields'), PRODUCT_FIELDS)
+            limit = parse_limit(request.args, default=10, maximum=MAX_RELATED)
+            product_ids = category_bitsets.related(db.session, id, limit)
+            if not product_ids and db.session.query(Product.id).filter_by(id=id).first() is None:
+                raise NotFound("Product not found")
+            return listing_response(encode_products(product_ids, fields), None)
+        except NotFound as e:
+            return make_response({"error": str(e)}, 404)
+        except ImportError:
+            return make_response({"error": "Related products are unavailable: NumPy is not installed"}, 503)
+        except BadRequest as e:
+            return make_response({"error": e.description}, 400)
         except Exception as e:
             return make_response({"error": "Internal server error"}, 500)
 
-api.add_resource(ProductResource, '/products','/products/<int:id>')
+api.add_resource(RelatedProductsResource, '/products/<int:id>/related')
+
+@app.cli.command('sweep-reservations')
+def sweep_reservations():
+    """Hand the stock of expired cart reservations back now."""
+    print(f"Released {stock.sweep(db.session)} expired reservations")
+
+@app.cli.command('rebuild-recommendations')
+def rebuild_recommendations():
+    """Recompute the product recommendations now."""
+    print(f"Stored {recommendations.rebuild(db.session)} recommendations")
     
+def list_categories(fields, category_id=None):
+    """Category dicts with product_count, counted for every category at once in one GROUP BY."""
+    columns = None if fields is None else tuple(key for key in fields if key != 'product_count')
+    with_count = fields is None or 'product_count' in fields
+    query = Category.query.options(*load_fields(Category, columns)).order_by(Category.id)
+    if with_count:
+        query = (
+            query.outerjoin(product_category, product_category.c.category_id == Category.id)
+            .group_by(Category.id)
+            .add_columns(func.count(product_category.c.product_id))
+        )
+    if category_id is not None:
+        query = query.filter(Category.id == category_id)
+
+    categories = []
+    for row in query:
+        category, product_count = row if with_count else (row, None)
+        data = category.to_dict(only = columns or (), rules = CATEGORY_RULES) if columns != () else {}
+        if with_count:
+            data['product_count'] = product_count
+        categories.append(data)
+    return categories
+
 # category resource for both all and one category
 class CategoryResource(Resource):
-    def get(self, category_id=None):
+    @catalog_version.conditional
+    @response_cache.cached(*CATALOG_TABLES)
+    def get(self, category_id=None, slug=None):
         try:
+            fields = parse_fields(request.args.get('fields'), CATEGORY_FIELDS)
+            if slug is not None:
+                category_id = category_slugs.resolve(slug)
+                if category_id is None:
+                    raise NotFound()
             if category_id:
-                category = Category.query.get_or_404(category_id)
-                return make_response(category.to_dict(rules = ('-products.cart_items','products.wishlist_items',)),200)
-            return make_response([category.to_dict(rules = ('-products.cart_items','products.wishlist_items',)) for category in Category.query.all()])
+                categories = list_categories(fields, category_id)
+                if not categories:
+                    raise NotFound()
+                return make_response(categories[0],200)
+            return make_response(list_categories(fields))
         except NotFound:
             return {'error': 'Category not found'}, 404
+        except BadRequest as e:
+            return {'error': e.description}, 400
         except Exception as e:
             return {'error': str(e)}, 500
-api.add_resource(CategoryResource, '/categories','/categories/<int:category_id>')
+api.add_resource(CategoryResource, '/categories','/categories/<int:category_id>','/categories/<string:slug>')
+
+# Products of one category (?subtree=1: of its whole subtree), keyset-paginated by product id
+class CategoryProductsResource(Resource):
+    @catalog_version.conditional
+    @response_cache.cached(*CATALOG_TABLES)
+    def get(self, category_id=None, slug=None):
+        try:
+            fields = parse_fields(request.args.get('fields'), PRODUCT_FIELDS)
+            if slug is not None:
+                category_id = category_slugs.resolve(slug)
+            elif db.session.get(Category, category_id) is None:
+                category_id = None
+            if category_id is None:
+                raise NotFound()
 
+            members = db.session.query(product_category.c.product_id)
+            if request.args.get('subtree'):
+                # Every product filed anywhere under this category, via the closure table
+                members = (
+                    members.join(category_closure, category_closure.c.descendant_id == product_category.c.category_id)
+                    .filter(category_closure.c.ancestor_id == category_id)
+                    .distinct()
+                )
+            else:
+                members = members.filter(product_category.c.category_id == category_id)
+            rows, next_cursor = keyset_page(
+                members, [product_category.c.product_id],
+                cursor=request.args.get('cursor'),
+                limit=parse_limit(request.args),
+            )
+            return listing_response(encode_products([row.product_id for row in rows], fields), next_cursor)
+        except NotFound:
+            return {'error': 'Category not found'}, 404
+        except BadRequest as e:
+            return {'error': e.description}, 400
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+api.add_resource(CategoryProductsResource, '/categories/<int:category_id>/products','/categories/<string:slug>/products')
+
+# Path from the root category down to this one, in a single closure-table query
+class CategoryBreadcrumbsResource(Resource):
+    @catalog_version.conditional
+    @response_cache.cached(*CATALOG_TABLES)
+    def get(self, category_id=None, slug=None):
+        try:
+            if slug is not None:
+                category_id = category_slugs.resolve(slug)
+            ancestors = (
+                Category.query
+                .join(category_closure, category_closure.c.ancestor_id == Category.id)
+                .filter(category_closure.c.descendant_id == category_id)
+                .order_by(category_closure.c.depth.desc())
+                .all()
+            )
+            if not ancestors:
+                raise NotFound()
+            return make_response([category.to_dict(rules = CATEGORY_RULES) for category in ancestors], 200)
+        except NotFound:
+            return {'error': 'Category not found'}, 404
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+api.add_resource(CategoryBreadcrumbsResource, '/categories/<int:category_id>/breadcrumbs','/categories/<string:slug>/breadcrumbs')
+
+# Hit/miss/eviction counters for sizing the response cache
+class CacheStatsResource(Resource):
+    def get(self):
+        return make_response(response_cache.stats(), 200)
+
+api.add_resource(CacheStatsResource, '/cache/stats')
+
+def cart_line_response(line, status=200):
+    """A cart line as JSON, with its version as the ETag that PATCH accepts in If-Match."""
+    response = make_response(line, status)
+    response.set_etag(str(line['version']))
+    return response
+
+# Carts and wishlists belong to the shopper's session (see shoppers.current_session_id);
+# every query below is bounded by it and seeks on the (session_id, product_id) index
 class CartItemResource(Resource):
-    # GET: List all cart items 
+    # GET: List the shopper's cart items
     def get(self):
         try:
-            cart_items = CartItem.query.all()  
-            return jsonify([item.to_dict() for item in cart_items])
+            return jsonify(carts.lines(db.session, CartItem, current_session_id()))
+        except BadRequest as e:
+            return {'error': e.description}, 400
         except Exception as e:
             return {'error': str(e)}, 500
 
-    #Adding a new item to cart
+    #Adding a new item to cart, or more of one already in it: a stock reservation (for
+    # stock-tracked products) and a single upsert statement, in one transaction
     def post(self):
         try:
             data = request.get_json()
@@ -68,22 +409,28 @@ class CartItemResource(Resource):
 
             if not product_id:
                 return {'error': 'Product ID is required'}, 400
-            
-            product = Product.query.get_or_404(product_id)
-
-        
-            cart_item = CartItem.query.filter_by(product_id=product_id).first()
-            if cart_item:
-                cart_item.quantity += quantity
-            else:
-                cart_item = CartItem(product_id=product_id, quantity=quantity)
-                db.session.add(cart_item)
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+                return {'error': 'Quantity must be a positive integer'}, 400
 
+            session_id = current_session_id()
+            stock.reserve(db.session, session_id, product_id, quantity)
+            cart_item = db.session.scalars(carts.add_line(session_id, product_id, quantity)).first()
+            if cart_item is None:
+                raise NotFound()
+            data = carts.lines(db.session, CartItem, session_id, item_id=cart_item.id)[0]
+            carts.touch(db.session, session_id)
             db.session.commit()
-            return jsonify(cart_item.to_dict()), 201
+            return cart_line_response(data, 201)
 
         except NotFound:
+            db.session.rollback()
             return {'error': 'Product not found'}, 404
+        except Conflict as e:
+            db.session.rollback()
+            return {'error': e.description}, 409
+        except BadRequest as e:
+            db.session.rollback()
+            return {'error': e.description}, 400
         except Exception as e:
             db.session.rollback()
             return {'error': str(e)}, 500
@@ -91,11 +438,57 @@ class CartItemResource(Resource):
 
 api.add_resource(CartItemResource, '/cart')
 
+# Many cart changes in one request and one transaction, answered with the resulting cart
+class CartBatchResource(Resource):
+    def post(self):
+        try:
+            data = request.get_json(silent=True) or {}
+            if not isinstance(data, dict):
+                raise BadRequest("Request body must be a JSON object")
+            session_id = current_session_id()
+            carts.apply_batch(db.session, session_id, data.get('operations'))
+            carts.touch(db.session, session_id)
+            db.session.commit()
+            return jsonify(carts.lines(db.session, CartItem, session_id))
+
+        except NotFound as e:
+            db.session.rollback()
+            return {'error': e.description}, 404
+        except Conflict as e:
+            db.session.rollback()
+            return {'error': e.description}, 409
+        except BadRequest as e:
+            db.session.rollback()
+            return {'error': e.description}, 400
+        except Exception as e:
+            db.session.rollback()
+            return {'error': str(e)}, 500
+
+api.add_resource(CartBatchResource, '/cart/batch')
+
+# Item count and subtotal for badges and mini-carts, without serializing the lines
+class CartSummaryResource(Resource):
+    def get(self):
+        try:
+            return make_response(carts.summaries.get(db.session, current_session_id()), 200)
+        except BadRequest as e:
+            return {'error': e.description}, 400
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+api.add_resource(CartSummaryResource, '/cart/summary')
+
 class CartItemResourceByID(Resource):
     def get(self, item_id):
         try:
-            cart_item = CartItem.query.get_or_404(item_id)
-            return jsonify(cart_item.to_dict())
+            cart_lines = carts.lines(db.session, CartItem, current_session_id(), item_id=item_id)
+            if not cart_lines:
+                raise NotFound()
+            return cart_line_response(cart_lines[0])
+        except NotFound:
+            return {'error': 'Cart item not found'}, 404
+        except BadRequest as e:
+            return {'error': e.description}, 400
         except Exception as e:
             return {'error': str(e)}, 500
         
@@ -104,29 +497,59 @@ class CartItemResourceByID(Resource):
             data = request.get_json()
             quantity = data.get('quantity')
 
-            if not quantity or quantity < 1:
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
                 return {'error': 'Valid quantity is required'}, 400
 
-            cart_item = CartItem.query.get_or_404(item_id)
-            cart_item.quantity = quantity
+            # The line's quantity tells how much stock to reserve or give back, and the UPDATE
+            # is a compare-and-set on the version read with it: a write committed in between
+            # (or a stale If-Match) gets 412 instead of a stock change worked out from old data
+            session_id = current_session_id()
+            line = db.session.query(CartItem.product_id, CartItem.quantity, CartItem.version).filter_by(id=item_id, session_id=session_id).first()
+            if line is None:
+                raise NotFound()
+            if not carts.version_matches(request.if_match, line.version):
+                return {'error': 'Cart item was changed by another request, reload it and retry'}, 412
+
+            version = db.session.execute(carts.set_quantity(session_id, item_id, quantity, line.version)).scalar()
+            if version is None:
+                db.session.rollback()
+                return {'error': 'Cart item was changed by another request, reload it and retry'}, 412
+            if quantity > line.quantity:
+                stock.reserve(db.session, session_id, line.product_id, quantity - line.quantity)
+            elif quantity < line.quantity:
+                stock.release(db.session, session_id, {line.product_id: line.quantity - quantity})
+            carts.touch(db.session, session_id)
             db.session.commit()
-            return jsonify(cart_item.to_dict())
+            return cart_line_response(carts.lines(db.session, CartItem, session_id, item_id=item_id)[0])
 
         except NotFound:
+            db.session.rollback()
             return {'error': 'Cart item not found'}, 404
+        except Conflict as e:
+            db.session.rollback()
+            return {'error': e.description}, 409
+        except BadRequest as e:
+            db.session.rollback()
+            return {'error': e.description}, 400
         except Exception as e:
             db.session.rollback()
             return {'error': str(e)}, 500
 
     def delete(self, item_id):
         try:
-            cart_item = CartItem.query.get_or_404(item_id)
+            session_id = current_session_id()
+            cart_item = CartItem.query.filter_by(id=item_id, session_id=session_id).first_or_404()
             db.session.delete(cart_item)
+            db.session.flush()
+            stock.release(db.session, session_id, {cart_item.product_id: cart_item.quantity})
+            carts.touch(db.session, session_id)
             db.session.commit()
             return {'message': 'Item removed from cart'}, 200
 
         except NotFound:
             return {'error': 'Cart item not found'}, 404
+        except BadRequest as e:
+            return {'error': e.description}, 400
         except Exception as e:
             db.session.rollback()
             return {'error': str(e)}, 500
@@ -134,11 +557,12 @@ class CartItemResourceByID(Resource):
 api.add_resource(CartItemResourceByID, '/cart/<int:item_id>')
 
 class WishlistResource(Resource):
-    # Get all wishlist items
+    # Get the shopper's wishlist items
     def get(self):
         try:
-            wishlist_items = WishlistItem.query.all()  # Add user_id filter if needed
-            return jsonify([item.to_dict() for item in wishlist_items])
+            return jsonify(carts.lines(db.session, WishlistItem, current_session_id()))
+        except BadRequest as e:
+            return {'error': e.description}, 400
         except Exception as e:
             return {'error': str(e)}, 500
 
@@ -153,17 +577,20 @@ class WishlistResource(Resource):
             
             Product.query.get_or_404(product_id)
 
-            existing = WishlistItem.query.filter_by(product_id=product_id).first()
+            session_id = current_session_id()
+            existing = WishlistItem.query.filter_by(session_id=session_id, product_id=product_id).first()
             if existing:
                 return {'error': 'Product already in wishlist'}, 409
 
-            new_item = WishlistItem(product_id=product_id)
+            new_item = WishlistItem(session_id=session_id, product_id=product_id)
             db.session.add(new_item)
             db.session.commit()
-            return jsonify(new_item.to_dict()), 201
+            return make_response(carts.lines(db.session, WishlistItem, session_id, item_id=new_item.id)[0], 201)
 
         except NotFound:
             return {'error': 'Product not found'}, 404
+        except BadRequest as e:
+            return {'error': e.description}, 400
         except Exception as e:
             db.session.rollback()
             return {'error': str(e)}, 500
@@ -174,12 +601,14 @@ class WishlistItemResource(Resource):
     # Remove from wishlist
     def delete(self, item_id):
         try:
-            item = WishlistItem.query.get_or_404(item_id)
+            item = WishlistItem.query.filter_by(id=item_id, session_id=current_session_id()).first_or_404()
             db.session.delete(item)
             db.session.commit()
             return {'message': 'Item removed from wishlist'}, 200
         except NotFound:
             return {'error': 'Wishlist item not found'}, 404
+        except BadRequest as e:
+            return {'error': e.description}, 400
         except Exception as e:
             db.session.rollback()
             return {'error': str(e)}, 500
@@ -188,4 +617,11 @@ class WishlistItemResource(Resource):
 api.add_resource(WishlistItemResource, '/wishlist/items/<int:item_id>')
 
 if __name__ == '__main__':
+    # The debug reloader re-runs this file in a child process that does the serving;
+    # only start the index and background threads there, not in the watching parent too
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        with app.app_context():
+            suggest_index.build(db.session)
+        recommendations.rebuild_job.start(app, db.session)
+        stock.start_sweeper(app, db.session)
     app.run(debug=True,port=5555)
\ No newline at end of file
@@ -0,0 +1,234 @@
+import threading
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import request, Response
+import changes
+
+
+class ResponseCache:
+    """
+    Bounded LRU of rendered GET responses keyed by path + normalized query string.
+    Every entry is tagged with the tables it was built from and is dropped as soon as a
+    commit writes to one of them.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        changes.on_commit(self._on_commit)
+
+    def init_app(self, app):
+        self.max_entries = app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES', self.max_entries)
+        self.max_bytes = app.config.setdefault('RESPONSE_CACHE_MAX_BYTES', self.max_bytes)
+
+    @staticmethod
+    def key_for(req):
+        args = sorted(req.args.items(multi=True))
+        return f"{req.path}?{urlencode(args)}" if args else req.path
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, tables, response, generation):
+        body = response.get_data()
+        cost = len(key) + len(body)
+        if cost > self.max_bytes:
+            return
+        entry = (frozenset(tables), response.status_code, response.mimetype, body, cost)
+        with self._lock:
+            if generation != self._generation:
+                # A commit landed while this response was being built, it may already be stale
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[-1]
+            self._entries[key] = entry
+            self.size += cost
+            while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted[-1]
+                self.evictions += 1
+
+    def invalidate(self, tables):
+        tables = set(tables)
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, entry in self._entries.items() if entry[0] & tables]
+            for key in stale:
+                self.size -= self._entries.pop(key)[-1]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.size = 0
+
+    def _on_commit(self, changed):
+        self.invalidate(changed.keys())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def cached(self, *tables):
+        """Decorator for Resource.get methods whose output only depends on `tables`."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                key = self.key_for(request)
+                entry = self.get(key)
+                if entry is not None:
+                    _, status, mimetype, body, _ = entry
+                    response = Response(body, status=status, mimetype=mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                generation = self._generation
+                response = func(*args, **kwargs)
+                if isinstance(response, Response) and response.status_code == 200 and not response.is_streamed:
+                    self.put(key, tables, response, generation)
+                    response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+
+class VersionCounter:
+    """
+    Monotonic in-process version of a group of tables, bumped by every commit that writes
+    to them. Its value doubles as a strong ETag, so conditional GETs can be answered with
+    304 before any query runs.
+    """
+
+    def __init__(self, *tables):
+        self.tables = set(tables)
+        self.value = 0
+        # Keeps ETags from a previous process (with its own count) from ever matching
+        self._boot = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        changes.on_commit(self._on_commit)
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+
+    def _on_commit(self, changed):
+        if self.tables.intersection(changed):
+            self.bump()
+
+    @property
+    def etag(self):
+        return f"{self._boot}-{self.value}"
+
+    def conditional(self, func):
+        """Decorator for Resource.get methods: answers If-None-Match and tags 200s with the ETag."""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # Read before the handler runs so a concurrent write can only make the tag older
+            etag = self.etag
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            response = func(*args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return wrapper
+
+
+class FragmentCache:
+    """
+    Encoded JSON of individual rows of `table`, keyed by (row id, row version, representation)
+    so list responses can be spliced together from bytes instead of re-serialized.
+
+    Row versions are bumped after commits that write the row itself or one of its `links`
+    (association tables, mapped to the position of the row id in their key). A write to any
+    of `dependencies` bumps the epoch shared by every row. Versions are read before the row
+    is loaded, so a fragment built from data that a concurrent commit replaced is filed under
+    an outdated version and never served.
+    """
+
+    def __init__(self, table, links=None, dependencies=(), max_entries=50000):
+        self.table = table
+        self.links = dict(links or {})
+        self.dependencies = set(dependencies)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        changes.on_commit(self._on_commit)
+
+    def version(self, row_id):
+        return (self._epoch, self._versions.get(row_id, 0))
+
+    def get_many(self, row_ids, representation):
+        """Returns ({row_id: fragment} for the cached rows, {row_id: version} to store the rest under)."""
+        found, versions = {}, {}
+        with self._lock:
+            for row_id in row_ids:
+                version = self.version(row_id)
+                key = (row_id, version, representation)
+                fragment = self._entries.get(key)
+                if fragment is None:
+                    versions[row_id] = version
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    found[row_id] = fragment
+                    self.hits += 1
+        return found, versions
+
+    def put(self, row_id, version, representation, fragment):
+        with self._lock:
+            self._entries[(row_id, version, representation)] = fragment
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _on_commit(self, changed):
+        with self._lock:
+            if self.dependencies.intersection(changed):
+                self._epoch += 1
+                return
+            touched = set(changed.get(self.table, ()))
+            for table, position in self.links.items():
+                touched.update(key if key is changes.ALL_ROWS else key[position] for key in changed.get(table, ()))
+            if changes.ALL_ROWS in touched:
+                self._epoch += 1
+                return
+            for row_id in touched:
+                self._versions[row_id] = self._versions.get(row_id, 0) + 1
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,267 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import select, literal, delete, update, func
+from sqlalchemy.dialects.sqlite import insert
+from werkzeug.exceptions import BadRequest, NotFound
+import changes
+import stock
+from models import CartItem, Product
+
+# Pseudo-table recorded in changes: the session ids whose carts a transaction wrote
+CART_SESSIONS = 'cart_sessions'
+
+
+def touch(session, session_id):
+    """Mark `session_id`'s cart as written by the session's current transaction."""
+    changes.record(session, CART_SESSIONS, session_id)
+
+
+def add_line(session_id, product_id, quantity):
+    """
+    Statement adding `quantity` of a product to a shopper's cart, RETURNING the resulting
+    line: INSERT ... SELECT ... ON CONFLICT (session_id, product_id) DO UPDATE. The existence
+    check, the insert and the increment are one atomic statement, so concurrent adds can't
+    lose each other's quantities. Selecting from products makes an unknown product_id
+    insert (and return) nothing.
+    """
+    stmt = insert(CartItem).from_select(
+        ['session_id', 'product_id', 'quantity'],
+        select(literal(session_id), Product.id, literal(quantity)).where(Product.id == product_id),
+    )
+    return (
+        stmt.on_conflict_do_update(
+            index_elements=[CartItem.session_id, CartItem.product_id],
+            set_={'quantity': CartItem.quantity + stmt.excluded.quantity, 'version': CartItem.version + 1},
+        )
+        .returning(CartItem)
+        .execution_options(populate_existing=True)
+    )
+
+
+def set_quantity(session_id, item_id, quantity, version):
+    """
+    Statement setting a cart line's quantity and bumping its version, RETURNING the new
+    version, only while the line is still at `version`: a compare-and-set in the UPDATE's
+    WHERE clause, so a write committed after the caller read the line matches no row.
+    """
+    return (
+        update(CartItem)
+        .where(CartItem.id == item_id, CartItem.session_id == session_id, CartItem.version == version)
+        .values(quantity=quantity, version=CartItem.version + 1)
+        .returning(CartItem.version)
+    )
+
+
+def version_matches(if_match, version):
+    """Whether an If-Match header (werkzeug ETags) lets a write go ahead on a line at `version`."""
+    return not if_match or if_match.contains(str(version))
+
+
+# Product columns embedded in every cart/wishlist line
+LINE_PRODUCT_FIELDS = ('id', 'name', 'slug', 'price', 'image_url')
+
+
+def lines(session, model, session_id, item_id=None):
+    """
+    A shopper's cart or wishlist lines (`model` is CartItem or WishlistItem), or just line
+    `item_id`, each with a flat projection of its product. One join query whatever the
+    number of lines: no per-line product loads and no nested relationships.
+    """
+    product_columns = [getattr(Product, key).label(f'product__{key}') for key in LINE_PRODUCT_FIELDS]
+    query = (
+        select(model.__table__, *product_columns)
+        .join(Product, Product.id == model.product_id)
+        .where(model.session_id == session_id)
+        .order_by(model.id)
+    )
+    if item_id is not None:
+        query = query.where(model.id == item_id)
+
+    keys = model.__table__.columns.keys()
+    result = []
+    for row in session.execute(query).mappings():
+        line = {key: row[key] for key in keys}
+        line['product'] = {key: row[f'product__{key}'] for key in LINE_PRODUCT_FIELDS}
+        result.append(line)
+    return result
+
+
+# Most operations one POST /cart/batch may carry
+MAX_BATCH_OPERATIONS = 100
+BATCH_OPERATIONS = ('add', 'set', 'remove', 'clear')
+
+
+def _quantity(operation):
+    quantity = operation.get('quantity', 1)
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+        raise BadRequest("Quantity must be a positive integer")
+    return quantity
+
+
+def plan_batch(operations):
+    """
+    Fold a list of {"op": add|set|remove|clear, "product_id", "quantity"} operations, in
+    order, into (clear, removes, sets, adds): whether the cart is emptied first, then the
+    product ids to delete, {product_id: quantity} to overwrite and {product_id: quantity}
+    to increment. Each product ends up in at most one of them, so the three can run as one
+    statement each without depending on each other's order.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise BadRequest("operations must be a non-empty list")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise BadRequest(f"At most {MAX_BATCH_OPERATIONS} operations can be sent at once")
+
+    clear = False
+    lines = {}
+    for operation in operations:
+        kind = operation.get('op') if isinstance(operation, dict) else None
+        if kind not in BATCH_OPERATIONS:
+            raise BadRequest(f"op must be one of: {', '.join(BATCH_OPERATIONS)}")
+        if kind == 'clear':
+            clear, lines = True, {}
+            continue
+        product_id = operation.get('product_id')
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            raise BadRequest("product_id must be an integer")
+
+        if kind == 'remove':
+            lines[product_id] = ('remove', None)
+        elif kind == 'set':
+            lines[product_id] = ('set', _quantity(operation))
+        else:
+            previous, quantity = lines.get(product_id, (None, 0))
+            if previous == 'add' or (previous is None and not clear):
+                lines[product_id] = ('add', quantity + _quantity(operation))
+            else:
+                # On top of a set, a remove or a cleared cart the final quantity is known
+                lines[product_id] = ('set', (quantity or 0) + _quantity(operation))
+
+    removes = [product_id for product_id, (kind, _) in lines.items() if kind == 'remove']
+    sets = {product_id: quantity for product_id, (kind, quantity) in lines.items() if kind == 'set'}
+    adds = {product_id: quantity for product_id, (kind, quantity) in lines.items() if kind == 'add'}
+    return clear, removes, sets, adds
+
+
+def apply_batch(session, session_id, operations):
+    """
+    Validate and apply a batch to one shopper's cart in the session's transaction: one IN
+    query checks every product id, then at most one DELETE for the clear, one for the
+    removals and one executemany upsert each for the sets and the increments.
+
+    Stock follows the quantity changes: removed and lowered lines give back their reserved
+    units, and every increase is reserved with one executemany conditional UPDATE (Conflict
+    when short). The old quantities come from the cart writes themselves (DELETE ...
+    RETURNING, and a version bump UPDATE ... RETURNING before the sets), so no other
+    request can change them between the read and the write.
+    """
+    clear, removes, sets, adds = plan_batch(operations)
+
+    product_ids = set(sets) | set(adds)
+    if product_ids:
+        found = set(session.scalars(select(Product.id).where(Product.id.in_(product_ids))))
+        missing = sorted(product_ids - found)
+        if missing:
+            raise NotFound(f"Unknown product id(s): {', '.join(map(str, missing))}")
+
+    decreases = {}
+    lines = delete(CartItem).where(CartItem.session_id == session_id)
+    if clear:
+        session.execute(lines)
+    elif removes:
+        removed = lines.where(CartItem.product_id.in_(removes)).returning(CartItem.product_id, CartItem.quantity)
+        decreases.update(session.execute(removed).all())
+
+    current = {}
+    if sets and not clear:
+        # Lines about to be overwritten get their version bump first: the write takes SQLite's
+        # write lock, so the quantities it returns are still current when the upsert runs
+        bumped = (
+            update(CartItem)
+            .where(CartItem.session_id == session_id, CartItem.product_id.in_(sets))
+            .values(version=CartItem.version + 1)
+            .returning(CartItem.product_id, CartItem.quantity)
+        )
+        current = dict(session.execute(bumped).all())
+
+    increases = dict(adds)
+    for product_id, quantity in sets.items():
+        change = quantity - current.get(product_id, 0)
+        if change > 0:
+            increases[product_id] = change
+        elif change < 0:
+            decreases[product_id] = -change
+
+    for quantities, increment in ((sets, False), (adds, True)):
+        if not quantities:
+            continue
+        stmt = insert(CartItem)
+        # Existing lines a set overwrites had their version bumped above
+        set_ = {'quantity': CartItem.quantity + stmt.excluded.quantity, 'version': CartItem.version + 1} \
+            if increment else {'quantity': stmt.excluded.quantity}
+        session.execute(
+            stmt.on_conflict_do_update(index_elements=[CartItem.session_id, CartItem.product_id], set_=set_),
+            [{'session_id': session_id, 'product_id': product_id, 'quantity': amount}
+             for product_id, amount in quantities.items()],
+        )
+
+    # After the cart writes, so the transaction already holds the write lock (see stock.release)
+    if clear:
+        stock.release(session, session_id)
+    elif decreases:
+        stock.release(session, session_id, decreases)
+    stock.reserve_many(session, session_id, increases)
+
+
+def summary(session, session_id):
+    """Line count, item count and subtotal of a cart from one SUM join query."""
+    lines, items, subtotal = session.execute(
+        select(
+            func.count(CartItem.id),
+            func.coalesce(func.sum(CartItem.quantity), 0),
+            func.coalesce(func.sum(CartItem.quantity * Product.price), 0),
+        )
+        .join(Product, Product.id == CartItem.product_id)
+        .where(CartItem.session_id == session_id)
+    ).one()
+    return {"lines": lines, "item_count": items, "subtotal": round(subtotal, 2)}
+
+
+class SummaryCache:
+    """
+    Cart summaries by session id. Cart writes that call touch() evict their own cart;
+    other writes to cart_items, and any product write (prices), drop every summary.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        changes.on_commit(self._on_commit)
+
+    def _on_commit(self, changed):
+        with self._lock:
+            if 'products' in changed or ('cart_items' in changed and CART_SESSIONS not in changed):
+                self._entries.clear()
+            else:
+                for session_id in changed.get(CART_SESSIONS, ()):
+                    self._entries.pop(session_id, None)
+            self._generation += 1
+
+    def get(self, session, session_id):
+        with self._lock:
+            if session_id in self._entries:
+                self._entries.move_to_end(session_id)
+                return self._entries[session_id]
+            generation = self._generation
+        value = summary(session, session_id)
+        with self._lock:
+            # A commit landing while the query ran may have made it stale
+            if generation == self._generation:
+                self._entries[session_id] = value
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+
+summaries = SummaryCache()
@@ -0,0 +1,79 @@
+from sqlalchemy import event, inspect as sql_inspect
+from sqlalchemy.orm import Session
+
+# Key recorded when a statement touched an unknown set of rows (bulk UPDATE/DELETE, raw SQL)
+ALL_ROWS = None
+
+_listeners = []
+
+
+def on_commit(listener):
+    """
+    Register `listener(changes)` to run after every successful commit, where `changes`
+    maps each touched table name to the set of primary keys written (ALL_ROWS in the set
+    means "any row"). Usable as a decorator.
+    """
+    _listeners.append(listener)
+    return listener
+
+
+def record(session, table, key=ALL_ROWS):
+    """Mark `table` (and optionally one row of it) as written by the session's current transaction."""
+    session.info.setdefault('changes', {}).setdefault(table, set()).add(key)
+
+
+def _primary_key(obj):
+    identity = sql_inspect(obj).identity
+    if identity is None:
+        return ALL_ROWS
+    return identity[0] if len(identity) == 1 else identity
+
+
+def _record_links(session, obj, state):
+    # Many-to-many collection changes only show up as history on the owning object
+    for prop in state.mapper.relationships:
+        if prop.secondary is None:
+            continue
+        history = state.attrs[prop.key].history
+        if not (history.added or history.deleted):
+            continue
+        local = {secondary.name: getattr(obj, state.mapper.get_property_by_column(parent).key)
+                 for parent, secondary in prop.synchronize_pairs}
+        for other in list(history.added) + list(history.deleted):
+            other_mapper = sql_inspect(other).mapper
+            row = dict(local)
+            row.update({secondary.name: getattr(other, other_mapper.get_property_by_column(child).key)
+                        for child, secondary in prop.secondary_synchronize_pairs})
+            key = tuple(row.get(column.name) for column in prop.secondary.primary_key)
+            record(session, prop.secondary.name, key)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        state = sql_inspect(obj)
+        for table in state.mapper.tables:
+            record(session, table.name, _primary_key(obj))
+        _record_links(session, obj, state)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            record(orm_execute_state.session, table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch(session):
+    changes = session.info.pop('changes', None)
+    if not changes:
+        return
+    for listener in _listeners:
+        listener(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('changes', None)
@@ -0,0 +1,82 @@
+from sqlalchemy import select, func, case, literal, union_all
+from werkzeug.exceptions import BadRequest
+from models import Product, Category, product_category
+
+# Upper bounds of the price facet buckets; the last bucket is open-ended
+PRICE_BUCKETS = (100, 250, 500, 1000, 2000)
+
+
+def parse_filters(args):
+    """?category=slug[,slug...] (repeatable), ?min_price= and ?max_price= as a filter dict."""
+    slugs = sorted({slug.strip() for value in args.getlist('category') for slug in value.split(',') if slug.strip()})
+    filters = {'categories': tuple(slugs)}
+    for key in ('min_price', 'max_price'):
+        raw = args.get(key)
+        try:
+            filters[key] = float(raw) if raw not in (None, '') else None
+        except ValueError:
+            raise BadRequest(f"{key} must be a number")
+    if filters['min_price'] is not None and filters['max_price'] is not None \
+            and filters['min_price'] > filters['max_price']:
+        raise BadRequest("min_price must not exceed max_price")
+    return filters
+
+
+def apply_filters(query, filters):
+    """Restrict a query over products to the filter set (products in ANY of the given categories)."""
+    if filters['categories']:
+        in_categories = (
+            select(product_category.c.product_id)
+            .join(Category, Category.id == product_category.c.category_id)
+            .where(Category.slug.in_(filters['categories']))
+        )
+        query = query.filter(Product.id.in_(in_categories))
+    if filters['min_price'] is not None:
+        query = query.filter(Product.price >= filters['min_price'])
+    if filters['max_price'] is not None:
+        query = query.filter(Product.price <= filters['max_price'])
+    return query
+
+
+def _bucket(price):
+    return case(
+        *[(price < upper, index) for index, upper in enumerate(PRICE_BUCKETS)],
+        else_=len(PRICE_BUCKETS),
+    )
+
+
+def facet_counts(session, filters):
+    """
+    Product counts per category slug and per price bucket for the filtered set, from one
+    statement: the filtered products are computed once as a CTE and aggregated both ways.
+    """
+    filtered = apply_filters(session.query(Product.id, Product.price), filters).cte('filtered')
+
+    by_category = (
+        select(literal('category').label('facet'), Category.slug.label('value'), func.count().label('count'))
+        .select_from(filtered)
+        .join(product_category, product_category.c.product_id == filtered.c.id)
+        .join(Category, Category.id == product_category.c.category_id)
+        .group_by(Category.slug)
+    )
+    bucket = _bucket(filtered.c.price)
+    by_price = (
+        select(literal('price').label('facet'), bucket.label('value'), func.count().label('count'))
+        .select_from(filtered)
+        .group_by(bucket)
+    )
+
+    categories, price_counts = {}, {}
+    for facet, value, count in session.execute(union_all(by_category, by_price)):
+        if facet == 'category':
+            categories[value] = count
+        else:
+            price_counts[int(value)] = count
+
+    lowers = (0,) + PRICE_BUCKETS
+    uppers = PRICE_BUCKETS + (None,)
+    prices = [
+        {"min": lower, "max": upper, "count": price_counts.get(index, 0)}
+        for index, (lower, upper) in enumerate(zip(lowers, uppers))
+    ]
+    return {"categories": categories, "price": prices}
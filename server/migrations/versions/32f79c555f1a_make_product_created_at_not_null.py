@@ -0,0 +1,61 @@
+"""make product created_at not null
+
+Revision ID: 32f79c555f1a
+Revises: 02bc283d2424
+Create Date: 2026-10-16 22:59:39.847252
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '32f79c555f1a'
+down_revision = '02bc283d2424'
+branch_labels = None
+depends_on = None
+
+
+# The batch rebuild of products drops its triggers and the expression index, both are put back
+FTS_TRIGGERS = (
+    """
+    CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER products_fts_au AFTER UPDATE OF name, description ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+)
+
+
+def _rebuild_products(nullable):
+    op.drop_index('ix_products_name_nocase_id', table_name='products')
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.alter_column('created_at',
+               existing_type=sa.DATETIME(),
+               nullable=nullable)
+
+    for name in ('products_fts_ai', 'products_fts_ad', 'products_fts_au'):
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for trigger in FTS_TRIGGERS:
+        op.execute(trigger)
+    op.create_index('ix_products_name_nocase_id', 'products', [sa.text('name COLLATE NOCASE'), 'id'], unique=False)
+
+
+def upgrade():
+    # A NULL created_at on the last row of a page would end ?sort=created listings early
+    op.execute("UPDATE products SET created_at = datetime('now') || '.000000' WHERE created_at IS NULL")
+    _rebuild_products(nullable=False)
+
+
+def downgrade():
+    _rebuild_products(nullable=True)
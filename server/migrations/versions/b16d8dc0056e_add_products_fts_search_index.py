@@ -0,0 +1,51 @@
+"""add products_fts search index
+
+Revision ID: b16d8dc0056e
+Revises: 0756fa4b7182
+Create Date: 2026-10-16 22:37:57.283583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b16d8dc0056e'
+down_revision = '0756fa4b7182'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # External-content FTS5 index over products(name, description), kept in sync by triggers
+    op.execute("""
+        CREATE VIRTUAL TABLE products_fts USING fts5(
+            name, description,
+            content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    op.execute("""
+        CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER products_fts_au AFTER UPDATE OF name, description ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    """)
+    op.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS products_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS products_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS products_fts_ai")
+    op.execute("DROP TABLE IF EXISTS products_fts")
@@ -1,41 +1,104 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy_serializer import SerializerMixin
-from sqlalchemy import event, CheckConstraint
+from serializers import CompiledSerializerMixin
+from sqlalchemy import event, CheckConstraint, text, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from datetime import datetime
 from werkzeug.exceptions import BadRequest
 import re
+import secrets
 
 db = SQLAlchemy()
 
+# /products/<slug> paths that are routed to other resources
+RESERVED_PRODUCT_SLUGS = {'search', 'suggest'}
+
+def slugify(text):
+    """URL slug for a name: lowercase ASCII words joined by hyphens ("Sony WH-1000XM5" -> "sony-wh-1000xm5")."""
+    slug = re.sub(r'[^a-z0-9]+', '-', (text or '').lower()).strip('-')[:100].strip('-')
+    # All-digit slugs would be routed as ids, reserved ones to other endpoints
+    return f'product-{slug}' if slug.isdigit() or slug in RESERVED_PRODUCT_SLUGS else slug
+
 
 # Association table
 product_category = db.Table(
     'product_category',
     db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True),
     db.Column('category_id', db.Integer, db.ForeignKey('categories.id'), primary_key=True),
+    # The primary key serves product -> categories; this serves category -> products
+    db.Index('ix_product_category_category_id_product_id', 'category_id', 'product_id'),
     extend_existing=True
 )
 
-class Product(db.Model, SerializerMixin):
+# Closure table of the category tree: one row per (ancestor, descendant) pair, including
+# each category with itself at depth 0, so subtrees and breadcrumbs are single indexed lookups
+category_closure = db.Table(
+    'category_closure',
+    db.Column('ancestor_id', db.Integer, db.ForeignKey('categories.id'), primary_key=True),
+    db.Column('descendant_id', db.Integer, db.ForeignKey('categories.id'), primary_key=True),
+    db.Column('depth', db.Integer, nullable=False),
+    db.Index('ix_category_closure_descendant_id_depth', 'descendant_id', 'depth'),
+)
+
+# "Frequently added together" neighbours, rebuilt as a whole by recommendations.rebuild();
+# the (product_id, rank) primary key makes one product's list a single index range read
+product_recommendations = db.Table(
+    'product_recommendations',
+    db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True),
+    db.Column('rank', db.Integer, primary_key=True),
+    db.Column('recommended_id', db.Integer, db.ForeignKey('products.id'), nullable=False),
+    db.Column('score', db.Float, nullable=False),
+)
+
+# Units on hand; products without a row aren't stock-tracked. Kept out of `products` so
+# reservations (a write per add-to-cart) don't invalidate the catalog caches and indexes
+product_stock = db.Table(
+    'product_stock',
+    db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True),
+    db.Column('stock', db.Integer, nullable=False),
+    CheckConstraint('stock >= 0', name='check_stock_non_negative'),
+)
+
+# Stock held for a shopper's cart until expires_at, then handed back by stock.sweep()
+stock_reservations = db.Table(
+    'stock_reservations',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('session_id', db.String(64), nullable=False),
+    db.Column('product_id', db.Integer, db.ForeignKey('products.id'), nullable=False),
+    db.Column('quantity', db.Integer, nullable=False),
+    db.Column('expires_at', db.DateTime, nullable=False),
+    db.Index('ix_stock_reservations_session_id_product_id', 'session_id', 'product_id', unique=True),
+    db.Index('ix_stock_reservations_expires_at', 'expires_at'),
+)
+
+class Product(db.Model, CompiledSerializerMixin):
     __tablename__ = 'products'
     __table_args__ = (
         CheckConstraint('price > 0', name='check_price_positive'),
+        db.Index('ix_products_price_id', 'price', 'id'),
+        # Index-backed ?sort=name / ?sort=created keyset seeks
+        db.Index('ix_products_name_nocase_id', text('name COLLATE NOCASE'), 'id'),
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
     )
     
     serialize_rules = ('-cart_items.product', '-wishlist_items.product')
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
+    slug = db.Column(db.String(100), unique=True, index=True)
     price = db.Column(db.Float, nullable=False)
     description = db.Column(db.Text)
     image_url = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     # Relationships
+    # Plain list (not 'dynamic') so listings can batch-load it with selectinload
     categories = db.relationship(
         'Category', 
         secondary=product_category,
         back_populates='products',
-        lazy='dynamic'
+        lazy='select'
     )
     category_names = association_proxy('categories', 'name')
     cart_items = db.relationship('CartItem', back_populates='product', lazy=True)
@@ -47,6 +110,17 @@ class Product(db.Model, SerializerMixin):
             raise ValueError("Product name must be 1-100 characters")
         return name
 
+    def validate_slug(self, slug):
+        if not slug or len(slug) > 100:
+            raise ValueError("Slug must be 1-100 characters")
+        if not re.match(r'^[a-z0-9-]+$', slug):
+            raise ValueError("Slug can only contain lowercase letters, numbers, and hyphens")
+        if slug.isdigit():
+            raise ValueError("Slug can't be only digits")
+        if slug in RESERVED_PRODUCT_SLUGS:
+            raise ValueError(f"Slug can't be one of: {', '.join(sorted(RESERVED_PRODUCT_SLUGS))}")
+        return slug
+
     def validate_price(self, price):
         if not isinstance(price, (int, float)) or price <= 0:
             raise ValueError("Price must be a positive number")
@@ -62,6 +136,9 @@ class Product(db.Model, SerializerMixin):
     def __init__(self, **kwargs):
         try:
             self.name = self.validate_name(kwargs.get('name'))
+            # Slugs derived from the name are made unique at flush time (see dedupe_product_slugs)
+            self._slug_generated = not kwargs.get('slug')
+            self.slug = self.validate_slug(kwargs.get('slug') or slugify(self.name) or 'product')
             self.price = self.validate_price(kwargs.get('price'))
             self.description = kwargs.get('description')
             self.image_url = self.validate_image_url(kwargs.get('image_url'))
@@ -71,7 +148,7 @@ class Product(db.Model, SerializerMixin):
     def __repr__(self):
         return f'<Product {self.name}>'
 
-class Category(db.Model,SerializerMixin):
+class Category(db.Model, CompiledSerializerMixin):
     __tablename__ = 'categories'
 
     serialize_rules = ('-products.categories',)
@@ -79,6 +156,7 @@ class Category(db.Model,SerializerMixin):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
     slug = db.Column(db.String(50), unique=True, nullable=False)
+    parent_id = db.Column(db.Integer, db.ForeignKey('categories.id'), index=True)
 
     products = db.relationship(
         'Product',
@@ -105,23 +183,29 @@ class Category(db.Model,SerializerMixin):
         try:
             self.name = self.validate_name(kwargs.get('name'))
             self.slug = self.validate_slug(kwargs.get('slug'))
+            self.parent_id = kwargs.get('parent_id')
         except ValueError as e:
             raise BadRequest(str(e))
 
     def __repr__(self):
         return f'<Category {self.name}>'
 
-class CartItem(db.Model, SerializerMixin):
+class CartItem(db.Model, CompiledSerializerMixin):
     __tablename__ = 'cart_items'
     __table_args__ = (
         CheckConstraint('quantity > 0', name='check_quantity_positive'),
+        # One line per product in each shopper's cart; also the index every cart query seeks on
+        db.Index('ix_cart_items_session_id_product_id', 'session_id', 'product_id', unique=True),
     )
     
     serialize_rules = ('-product.cart_items', '-product.wishlist_items',)
     
     id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(64), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, default=1)
+    # Bumped by every write to the line; sent as its ETag and checked against If-Match
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     product = db.relationship('Product', back_populates='cart_items')
 
@@ -133,6 +217,7 @@ class CartItem(db.Model, SerializerMixin):
 
     def __init__(self, **kwargs):
         try:
+            self.session_id = kwargs.get('session_id')
             self.product_id = kwargs.get('product_id')
             self.quantity = self.validate_quantity(kwargs.get('quantity', 1))
         except ValueError as e:
@@ -141,27 +226,47 @@ class CartItem(db.Model, SerializerMixin):
     def __repr__(self):
         return f'<CartItem {self.product_id}>'
 
-class WishlistItem(db.Model, SerializerMixin):
+class WishlistItem(db.Model, CompiledSerializerMixin):
     __tablename__ = 'wishlist_items'
+    __table_args__ = (
+        db.Index('ix_wishlist_items_session_id_product_id', 'session_id', 'product_id', unique=True),
+    )
     
     serialize_rules = ('-product.cart_items', '-product.wishlist_items',)
     
     id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(64), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     
     product = db.relationship('Product', back_populates='wishlist_items')
 
     def __init__(self, **kwargs):
+        self.session_id = kwargs.get('session_id')
         self.product_id = kwargs.get('product_id')
 
     def __repr__(self):
         return f'<WishlistItem {self.product_id}>'
 
+# Schema objects autogenerate must leave alone: the FTS5 index (virtual + shadow tables) and
+# expression indexes, which SQLite reflection can't compare against the models
+UNMANAGED_TABLE_PREFIXES = ('products_fts',)
+EXPRESSION_INDEXES = {'ix_products_name_nocase_id'}
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Alembic include_object hook, passed to Migrate()."""
+    if type_ == 'table' and reflected and name.startswith(UNMANAGED_TABLE_PREFIXES):
+        return False
+    if type_ == 'index' and name in EXPRESSION_INDEXES:
+        return False
+    return True
+
 # Validation event listeners
 @event.listens_for(Product, 'before_update')
 def validate_product_before_update(mapper, connection, target):
     if hasattr(target, 'name'):
         target.validate_name(target.name)
+    if hasattr(target, 'slug'):
+        target.validate_slug(target.slug)
     if hasattr(target, 'price'):
         target.validate_price(target.price)
     if hasattr(target, 'image_url'):
@@ -178,3 +283,74 @@ def validate_category_before_update(mapper, connection, target):
 def validate_cart_item_before_update(mapper, connection, target):
     if hasattr(target, 'quantity'):
         target.validate_quantity(target.quantity)
+
+# Name-derived product slugs that are already taken get the new id appended, like the
+# backfill in the add_product_slug migration. The id only exists after the INSERT, so the
+# row goes in under a random placeholder slug that after_insert replaces.
+@event.listens_for(Session, 'before_flush')
+def dedupe_product_slugs(session, flush_context, instances):
+    new = [obj for obj in session.new if isinstance(obj, Product) and getattr(obj, '_slug_generated', False)]
+    if not new:
+        return
+    with session.no_autoflush:
+        taken = set(session.scalars(select(Product.slug).where(Product.slug.in_({product.slug for product in new}))))
+    for product in new:
+        if product.slug in taken:
+            product._slug_base = product.slug
+            product.slug = f'{product.slug[:91]}-{secrets.token_hex(4)}'
+        taken.add(product.slug)
+        product._slug_generated = False
+
+@event.listens_for(Product, 'after_insert')
+def finish_product_slug(mapper, connection, target):
+    base = getattr(target, '_slug_base', None)
+    if base is None:
+        return
+    slug = f'{base[:100 - len(str(target.id)) - 1]}-{target.id}'
+    connection.execute(update(Product.__table__).where(Product.__table__.c.id == target.id).values(slug=slug))
+    set_committed_value(target, 'slug', slug)
+    del target._slug_base
+
+# Closure table maintenance, all set-based SQL on the flush connection
+@event.listens_for(Category, 'after_insert')
+def add_category_to_tree(mapper, connection, target):
+    connection.execute(text("""
+        INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, :id, depth + 1 FROM category_closure WHERE descendant_id = :parent_id
+        UNION ALL SELECT :id, :id, 0
+    """), {"id": target.id, "parent_id": target.parent_id})
+
+@event.listens_for(Category, 'before_update')
+def check_category_move(mapper, connection, target):
+    if not db.inspect(target).attrs.parent_id.history.has_changes() or target.parent_id is None:
+        return
+    cycle = connection.execute(text("""
+        SELECT 1 FROM category_closure WHERE ancestor_id = :id AND descendant_id = :parent_id
+    """), {"id": target.id, "parent_id": target.parent_id}).first()
+    if cycle:
+        raise ValueError("A category can't be moved under itself or one of its descendants")
+
+@event.listens_for(Category, 'after_update')
+def move_category_subtree(mapper, connection, target):
+    if not db.inspect(target).attrs.parent_id.history.has_changes():
+        return
+    params = {"id": target.id, "parent_id": target.parent_id}
+    # Detach the subtree from its old ancestors...
+    connection.execute(text("""
+        DELETE FROM category_closure
+        WHERE descendant_id IN (SELECT descendant_id FROM category_closure WHERE ancestor_id = :id)
+          AND ancestor_id NOT IN (SELECT descendant_id FROM category_closure WHERE ancestor_id = :id)
+    """), params)
+    # ...and hang it under every ancestor of the new parent
+    connection.execute(text("""
+        INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+        SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1
+        FROM category_closure AS above, category_closure AS below
+        WHERE above.descendant_id = :parent_id AND below.ancestor_id = :id
+    """), params)
+
+@event.listens_for(Category, 'after_delete')
+def remove_category_from_tree(mapper, connection, target):
+    connection.execute(text("""
+        DELETE FROM category_closure WHERE ancestor_id = :id OR descendant_id = :id
+    """), {"id": target.id})
@@ -0,0 +1,100 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+from werkzeug.exceptions import BadRequest
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def parse_limit(args, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Read ?limit= from the query string, clamped to the hard maximum page size."""
+    raw = args.get('limit')
+    if raw is None:
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise BadRequest("limit must be an integer")
+    if limit < 1:
+        raise BadRequest("limit must be at least 1")
+    return min(limit, maximum)
+
+
+def encode_cursor(values):
+    """Opaque token for the keyset position of the last row on a page."""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _from_cursor(column, value):
+    # JSON has no datetimes, they travel as ISO strings
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = None
+    if value is not None and python_type is datetime:
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise BadRequest("Invalid cursor")
+    return value
+
+
+def decode_cursor(token, size):
+    """Inverse of encode_cursor; rejects tokens that do not hold `size` keys."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise BadRequest("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise BadRequest("Invalid cursor")
+    return values
+
+
+def _seek(columns, values, descending):
+    """
+    Rows strictly after `values` in (columns) order, spelled as a >= b AND (a > b OR (rest) > (...))
+    instead of a row-value comparison: SQLite only turns the leading bound into an index
+    range seek in this form when the column is an expression such as name COLLATE NOCASE.
+    """
+    column, value = columns[0], values[0]
+    after = column < value if descending else column > value
+    if len(columns) == 1:
+        return after
+    bound = column <= value if descending else column >= value
+    return and_(bound, or_(after, _seek(columns[1:], values[1:], descending)))
+
+
+def keyset_page(query, columns, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    """
+    Fetch one page of `query` ordered by `columns` (the last one must be unique, e.g. the id)
+    by seeking past the cursor instead of using OFFSET, so the cost of a page does not depend
+    on how deep it is. Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        values = [_from_cursor(column, value) for column, value in zip(columns, decode_cursor(cursor, len(columns)))]
+        query = query.filter(_seek(columns, values, descending))
+    order = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, column.key) for column in columns)
+    return rows, next_cursor
+
+
+def iter_pages(query, columns, batch_size, descending=False):
+    """Walk the whole of `query` one keyset page at a time, yielding each page's rows."""
+    cursor = None
+    while True:
+        rows, cursor = keyset_page(query, columns, cursor=cursor, limit=batch_size, descending=descending)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
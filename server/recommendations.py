@@ -0,0 +1,150 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import select, union_all
+import changes
+from models import CartItem, WishlistItem, product_recommendations
+
+# Neighbours kept per product
+TOP_K = 20
+# Baskets expanded into item pairs at a time; bounds the pair arrays held in memory
+BASKET_BLOCK = 5000
+# Seconds between background rebuilds (skipped when no cart/wishlist write happened)
+REBUILD_INTERVAL = 300
+BASKET_TABLES = ('cart_items', 'wishlist_items')
+
+
+def load_baskets(session):
+    """(basket key, product id) rows: one basket per shopper, their cart and wishlist together."""
+    carts = select(CartItem.session_id, CartItem.product_id)
+    wishlists = select(WishlistItem.session_id, WishlistItem.product_id)
+    return [tuple(row) for row in session.execute(union_all(carts, wishlists))]
+
+
+def compute_neighbours(baskets, k=TOP_K):
+    """
+    Top-k co-occurring products per product as (product_id, rank, recommended_id, score)
+    rows. Runs in a worker process: NumPy is only imported there.
+
+    Pairs of items sharing a basket are expanded block by block and counted with
+    np.unique, so only the non-zero cells of the product x product matrix ever exist.
+    Counts are normalized to cosine similarity, count(i, j) / sqrt(baskets(i) * baskets(j)),
+    so bestsellers don't become everyone's neighbour.
+    """
+    import numpy as np
+
+    if not baskets:
+        return []
+    basket_index = {}
+    basket = np.array([basket_index.setdefault(key, len(basket_index)) for key, _ in baskets], dtype=np.int64)
+    product_ids, column = np.unique(np.array([product_id for _, product_id in baskets], dtype=np.int64), return_inverse=True)
+    size = len(product_ids)
+
+    # One entry per (basket, product), ordered by basket
+    entries = np.unique(basket * size + column)
+    basket, column = entries // size, entries % size
+    product_baskets = np.bincount(column, minlength=size)
+    _, starts, sizes = np.unique(basket, return_index=True, return_counts=True)
+
+    block_codes, block_counts = [], []
+    for first in range(0, len(starts), BASKET_BLOCK):
+        block_starts, block_sizes = starts[first:first + BASKET_BLOCK], sizes[first:first + BASKET_BLOCK]
+        # Every entry is paired with every entry of its own basket (itself excluded)
+        entry_start = np.repeat(block_starts, block_sizes)
+        entry_size = np.repeat(block_sizes, block_sizes)
+        left = np.repeat(np.arange(block_starts[0], block_starts[0] + block_sizes.sum()), entry_size)
+        offset = np.arange(len(left)) - np.repeat(np.cumsum(entry_size) - entry_size, entry_size)
+        right = np.repeat(entry_start, entry_size) + offset
+        keep = left != right
+        codes, counts = np.unique(column[left[keep]] * size + column[right[keep]], return_counts=True)
+        block_codes.append(codes)
+        block_counts.append(counts)
+
+    codes, inverse = np.unique(np.concatenate(block_codes), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate(block_counts))
+    if not len(codes):
+        return []
+    source, target = codes // size, codes % size
+    scores = counts / np.sqrt(product_baskets[source] * product_baskets[target])
+
+    # Best first within each product, ties by product id; keep the first k of each run
+    order = np.lexsort((target, -scores, source))
+    source, target, scores = source[order], target[order], scores[order]
+    rank = np.arange(len(source)) - np.searchsorted(source, source, side='left')
+    keep = rank < k
+    return list(zip(
+        product_ids[source[keep]].tolist(), rank[keep].tolist(),
+        product_ids[target[keep]].tolist(), np.round(scores[keep], 6).tolist(),
+    ))
+
+
+def rebuild(session, executor=None, k=TOP_K):
+    """Recompute every product's neighbours off-process and swap them in with one transaction."""
+    baskets = load_baskets(session)
+    session.rollback()
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            rows = pool.submit(compute_neighbours, baskets, k).result()
+    else:
+        rows = executor.submit(compute_neighbours, baskets, k).result()
+
+    session.execute(product_recommendations.delete())
+    if rows:
+        session.execute(product_recommendations.insert(), [
+            {"product_id": product_id, "rank": rank, "recommended_id": recommended_id, "score": score}
+            for product_id, rank, recommended_id, score in rows
+        ])
+    session.commit()
+    return len(rows)
+
+
+def recommended_ids(session, product_id, limit):
+    """A product's neighbours, best first: one range read on the (product_id, rank) primary key."""
+    return session.execute(
+        select(product_recommendations.c.recommended_id)
+        .where(product_recommendations.c.product_id == product_id)
+        .order_by(product_recommendations.c.rank)
+        .limit(limit)
+    ).scalars().all()
+
+
+class RebuildJob:
+    """
+    Background thread rebuilding the recommendations every `interval` seconds through a
+    one-worker process pool, but only after carts or wishlists changed.
+    """
+
+    def __init__(self, interval=REBUILD_INTERVAL):
+        self.interval = interval
+        self._stale = threading.Event()
+        self._stale.set()
+        changes.on_commit(self._on_commit)
+
+    def _on_commit(self, changed):
+        if any(table in changed for table in BASKET_TABLES):
+            self._stale.set()
+
+    def start(self, app, session):
+        pool = ProcessPoolExecutor(max_workers=1)
+
+        def run():
+            while True:
+                if self._stale.is_set():
+                    self._stale.clear()
+                    with app.app_context():
+                        try:
+                            rebuild(session, pool)
+                        except Exception:
+                            session.rollback()
+                            app.logger.exception("Rebuilding recommendations failed")
+                            self._stale.set()
+                        finally:
+                            session.remove()
+                time.sleep(self.interval)
+
+        thread = threading.Thread(target=run, name='recommendations', daemon=True)
+        thread.start()
+        return thread
+
+
+rebuild_job = RebuildJob()
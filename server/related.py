@@ -0,0 +1,140 @@
+import threading
+import changes
+from models import Category, product_category
+
+# Related products kept per cached result; ?limit= is capped to this
+MAX_RELATED = 50
+
+
+def _numpy():
+    # Imported on first use, like in recommendations, so the app starts without NumPy
+    import numpy
+    return numpy
+
+
+class CategoryBitsets:
+    """
+    Every product's category membership packed into a row of bits (one bit per category),
+    so a product's related list is a couple of vectorized AND/OR + popcount passes over
+    the whole matrix instead of per-product SQL joins.
+
+    Results are cached per product. A commit that changes a product's category links
+    re-reads only that product's links and evicts the cached lists it can affect: its own
+    and those of products sharing a category with it before or after the change.
+    """
+
+    def __init__(self):
+        self._bits = None
+        self._rows = {}
+        self._product_ids = None
+        self._popcount = None
+        self._columns = {}
+        self._results = {}
+        self._dirty = set()
+        self._needs_build = True
+        self._lock = threading.Lock()
+        changes.on_commit(self._on_commit)
+
+    def _on_commit(self, changed):
+        with self._lock:
+            links = changed.get(product_category.name, set())
+            if changes.ALL_ROWS in links or changes.ALL_ROWS in changed.get('products', set()) \
+                    or changes.ALL_ROWS in changed.get('categories', set()):
+                self._needs_build = True
+            else:
+                self._dirty.update(product_id for product_id, _ in links)
+
+    def build(self, session):
+        np = _numpy()
+        # Cleared before reading, so commits landing during the build are applied afterwards
+        with self._lock:
+            self._needs_build = False
+            self._dirty.clear()
+        links = session.execute(product_category.select()).all()
+        category_ids = [row.id for row in session.query(Category.id).order_by(Category.id)]
+        product_ids = sorted({link.product_id for link in links})
+        with self._lock:
+            if self._popcount is None:
+                # Set bits in every byte value, for vectorized popcounts over the packed bitsets
+                self._popcount = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+            self._results.clear()
+            self._columns = {category_id: column for column, category_id in enumerate(category_ids)}
+            self._rows = {product_id: row for row, product_id in enumerate(product_ids)}
+            self._product_ids = np.array(product_ids, dtype=np.int64)
+            self._bits = np.zeros((len(product_ids), (len(category_ids) + 7) // 8), dtype=np.uint8)
+            for link in links:
+                self._set_bit(self._rows[link.product_id], link.category_id)
+
+    def _set_bit(self, row, category_id):
+        column = self._columns[category_id]
+        self._bits[row, column // 8] |= 1 << (column % 8)
+
+    def _refresh(self, session):
+        with self._lock:
+            needs_build = self._needs_build
+            dirty, self._dirty = self._dirty, set()
+        if needs_build:
+            return self.build(session)
+        if not dirty:
+            return
+
+        links = session.execute(product_category.select().where(product_category.c.product_id.in_(dirty))).all()
+        with self._lock:
+            if all(link.category_id in self._columns for link in links):
+                return self._apply(dirty, links)
+        # A category the matrix has no column for yet: start over
+        self.build(session)
+
+    def _apply(self, dirty, links):
+        np = _numpy()
+        # New products get their rows in one grow of the matrix, not one copy each
+        added = sorted(product_id for product_id in dirty if product_id not in self._rows)
+        if added:
+            for product_id in added:
+                self._rows[product_id] = len(self._rows)
+            self._product_ids = np.concatenate([self._product_ids, np.array(added, dtype=np.int64)])
+            self._bits = np.vstack([self._bits, np.zeros((len(added), self._bits.shape[1]), dtype=np.uint8)])
+
+        touched = np.zeros(self._bits.shape[1], dtype=np.uint8)
+        for product_id in dirty:
+            row = self._rows[product_id]
+            touched |= self._bits[row]
+            self._bits[row] = 0
+        for link in links:
+            self._set_bit(self._rows[link.product_id], link.category_id)
+        for product_id in dirty:
+            touched |= self._bits[self._rows[product_id]]
+            self._results.pop(product_id, None)
+
+        # Any product sharing a category with the old or new links may rank differently now
+        affected = self._product_ids[(self._bits & touched).any(axis=1)]
+        for product_id in affected.tolist():
+            self._results.pop(product_id, None)
+
+    def related(self, session, product_id, limit=10):
+        """Up to `limit` product ids ranked by Jaccard similarity of their category sets, best first."""
+        self._refresh(session)
+        with self._lock:
+            row = self._rows.get(product_id)
+            if row is None:
+                return []
+            if product_id not in self._results:
+                self._results[product_id] = self._compute(row)
+            return self._results[product_id][:limit]
+
+    def _compute(self, row):
+        np = _numpy()
+        bits = self._bits[row]
+        shared = self._popcount[self._bits & bits].sum(axis=1, dtype=np.int32)
+        union = self._popcount[self._bits | bits].sum(axis=1, dtype=np.int32)
+        shared[row] = 0
+        candidates = np.flatnonzero(shared)
+        if not len(candidates):
+            return []
+        scores = shared[candidates] / union[candidates]
+        # Best score first, ties by product id
+        order = np.lexsort((self._product_ids[candidates], -scores))[:MAX_RELATED]
+        return self._product_ids[candidates[order]].tolist()
+
+
+category_bitsets = CategoryBitsets()
@@ -0,0 +1,49 @@
+import re
+from sqlalchemy import text
+from werkzeug.exceptions import BadRequest
+from pagination import encode_cursor, decode_cursor
+
+FTS_TABLE = 'products_fts'
+
+# Ranked by bm25 (lower is better); ties broken by rowid so the keyset is total
+_SEARCH_SQL = text(f"""
+    SELECT rowid AS id, bm25({FTS_TABLE}) AS score
+    FROM {FTS_TABLE}
+    WHERE {FTS_TABLE} MATCH :match
+      AND (:after_score IS NULL OR bm25({FTS_TABLE}) > :after_score
+           OR (bm25({FTS_TABLE}) = :after_score AND rowid > :after_id))
+    ORDER BY score, rowid
+    LIMIT :limit
+""")
+
+
+def build_match(q):
+    """
+    Turn free text into an FTS5 query: every word must match, the last one as a prefix so
+    results show up while the user is still typing. Words are quoted, so FTS5 operators
+    and punctuation in the input are never interpreted.
+    """
+    words = re.findall(r'\w+', (q or '').lower())
+    if not words:
+        raise BadRequest("q must contain at least one word")
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_product_ids(session, q, cursor=None, limit=20):
+    """One page of matching product ids, best first. Returns (ids, next_cursor)."""
+    after_score, after_id = decode_cursor(cursor, 2) if cursor else (None, None)
+    rows = session.execute(_SEARCH_SQL, {
+        'match': build_match(q),
+        'after_score': after_score,
+        'after_id': after_id,
+        'limit': limit + 1,
+    }).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1].score, rows[-1].id])
+    return [row.id for row in rows], next_cursor
+
@@ -1,7 +1,10 @@
 from app import app
-from models import db, Product, Category, product_category, CartItem, WishlistItem
+from models import db, Product, Category, product_category, category_closure, product_recommendations, product_stock, stock_reservations, CartItem, WishlistItem
 from werkzeug.exceptions import BadRequest
 
+# Cart/wishlist owner of the sample data; send it as X-Session-Id to see them
+DEMO_SESSION_ID = 'demo-shopper-session'
+
 def seed_database():
     print("🌱 Seeding database with validation checks...")
     
@@ -10,7 +13,11 @@ def seed_database():
         print("Clearing existing data...")
         try:
             db.session.query(product_category).delete()
+            db.session.query(product_recommendations).delete()
+            db.session.query(stock_reservations).delete()
+            db.session.query(product_stock).delete()
             Product.query.delete()
+            db.session.query(category_closure).delete()
             Category.query.delete()
             CartItem.query.delete()
             WishlistItem.query.delete()
@@ -42,6 +49,16 @@ def seed_database():
 
         db.session.commit()
 
+        # Subcategories (Audio > Headphones)
+        try:
+            headphones = Category(name="Headphones", slug="headphones", parent_id=category_objects[2].id)
+            db.session.add(headphones)
+            category_objects.append(headphones)
+        except BadRequest as e:
+            print(f"⚠️ Failed to create category Headphones: {str(e)}")
+
+        db.session.commit()
+
         # Create products with validation
         print("Creating products...")
         products = [
@@ -94,7 +111,7 @@ def seed_database():
         relationships = [
             (0, [0, 5]),   # iPhone: Smartphones, Premium
             (1, [1, 3, 5]), # Alienware: Laptops, Gaming, Premium
-            (2, [2, 5]),    # Sony: Audio, Premium
+            (2, [6, 5]),    # Sony: Headphones (under Audio), Premium
             (3, [3, 5]),    # PS5: Gaming, Premium
             (4, [2, 3, 4])  # SteelSeries: Audio, Gaming, Accessories
         ]
@@ -109,11 +126,19 @@ def seed_database():
 
         db.session.commit()
 
+        # Stock levels (the SteelSeries headset stays untracked)
+        print("Setting stock levels...")
+        stock_levels = [(0, 25), (1, 5), (2, 40), (3, 3)]
+        db.session.execute(product_stock.insert(), [
+            {"product_id": product_objects[prod_idx].id, "stock": units} for prod_idx, units in stock_levels
+        ])
+        db.session.commit()
+
         # Create cart items with validation
         print("Creating cart items...")
         cart_items = [
-            {"product_id": 1, "quantity": 1},
-            {"product_id": 3, "quantity": 2}
+            {"session_id": DEMO_SESSION_ID, "product_id": 1, "quantity": 1},
+            {"session_id": DEMO_SESSION_ID, "product_id": 3, "quantity": 2}
         ]
 
         for item_data in cart_items:
@@ -127,8 +152,8 @@ def seed_database():
         # Create wishlist items
         print("Creating wishlist items...")
         wishlist_items = [
-            {"product_id": 2},
-            {"product_id": 4}
+            {"session_id": DEMO_SESSION_ID, "product_id": 2},
+            {"session_id": DEMO_SESSION_ID, "product_id": 4}
         ]
 
         for item_data in wishlist_items:
@@ -0,0 +1,135 @@
+from functools import lru_cache
+from sqlalchemy import inspect as sql_inspect
+from sqlalchemy.orm import ColumnProperty, RelationshipProperty
+from sqlalchemy_serializer import SerializerMixin
+from sqlalchemy_serializer.lib.schema import Schema
+from sqlalchemy_serializer.serializer import Serializer
+from werkzeug.exceptions import BadRequest
+
+# Guards against rule sets that would make the plan recurse forever
+MAX_DEPTH = 16
+
+
+class PlanTooDeep(Exception):
+    pass
+
+
+class CompiledSerializerMixin(SerializerMixin):
+    """
+    Drop-in SerializerMixin whose to_dict() runs a field-access plan compiled once per
+    (model, only, rules) instead of rebuilding a Serializer/Schema and re-walking the
+    mapper on every call. The output is the same dict the stock to_dict() produces.
+    """
+
+    def to_dict(self, only=(), rules=(), **kwargs):
+        if kwargs or type(self).get_tzinfo is not SerializerMixin.get_tzinfo:
+            return super().to_dict(only=only, rules=rules, **kwargs)
+        plan = compile_plan(type(self), tuple(only), tuple(rules))
+        if plan is None:
+            return super().to_dict(only=only, rules=rules)
+        return plan(self)
+
+
+@lru_cache(maxsize=None)
+def compile_plan(model, only=(), rules=()):
+    """Returns a callable turning a `model` instance into its dict, or None if it can't be compiled."""
+    schema = Schema()
+    schema.update(only=only, extend=rules)
+    try:
+        return _compile_model(model, schema, depth=0)
+    except PlanTooDeep:
+        return None
+
+
+def _options(model):
+    return dict(
+        date_format=model.date_format,
+        datetime_format=model.datetime_format,
+        time_format=model.time_format,
+        decimal_format=model.decimal_format,
+        tzinfo=None,
+        serialize_types=model.serialize_types,
+    )
+
+
+def _compile_model(model, schema, depth):
+    if depth > MAX_DEPTH:
+        raise PlanTooDeep(model)
+
+    # Same schema walk as Serializer.serialize_model, done once against the mapper
+    schema.update(only=model.serialize_only, extend=model.serialize_rules)
+    mapper = sql_inspect(model)
+    keys = schema.keys
+    if schema.is_greedy:
+        keys.update(attr.key for attr in mapper.attrs)
+
+    fields = []
+    for key in sorted(keys):
+        if not schema.is_included(key):
+            continue
+        prop = mapper.attrs.get(key)
+        if isinstance(prop, ColumnProperty) and not model.serialize_types:
+            fields.append((key, _column_converter(model, prop)))
+        elif isinstance(prop, RelationshipProperty) and issubclass(prop.mapper.class_, SerializerMixin):
+            nested = _compile_model(prop.mapper.class_, schema.fork(key), depth + 1)
+            fields.append((key, _relationship_converter(nested, prop.uselist)))
+        else:
+            fields.append((key, _generic_converter(model, schema, key)))
+
+    def plan(obj):
+        return {key: convert(getattr(obj, key)) for key, convert in fields}
+    return plan
+
+
+def _identity(value):
+    return value
+
+
+def _column_converter(model, prop):
+    try:
+        python_type = prop.columns[0].type.python_type
+    except (NotImplementedError, IndexError, AttributeError):
+        python_type = None
+    if python_type is not None and issubclass(python_type, Serializer.simple_types):
+        return _identity
+
+    # Dates, decimals, enums... keep the stock type dispatch for the rare non-scalar columns
+    serializer = Serializer(**_options(model))
+    return serializer.serialize
+
+
+def _relationship_converter(nested, uselist):
+    if uselist:
+        return lambda items: [nested(item) for item in items]
+    return lambda item: None if item is None else nested(item)
+
+
+def _generic_converter(model, schema, key):
+    # Association proxies, properties, callables: defer to the stock serializer for this key
+    options = _options(model)
+
+    def convert(value):
+        serializer = Serializer(**options)
+        serializer.schema = schema
+        return serializer.fork(key=key, value=value)
+    return convert
+
+
+def parse_fields(raw, allowed):
+    """Turn a ?fields=a,b,c value into a sorted tuple of keys, or None when absent."""
+    if raw is None:
+        return None
+    fields = tuple(sorted({field.strip() for field in raw.split(',') if field.strip()}))
+    if not fields:
+        raise BadRequest("fields must name at least one field")
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise BadRequest(f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return fields
+
+
+def restrict_rules(rules, fields):
+    """Drop the rules that reach into keys a sparse fieldset left out (they would re-add them)."""
+    if fields is None:
+        return rules
+    return tuple(rule for rule in rules if rule.lstrip('-').split('.')[0] in fields)
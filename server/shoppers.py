@@ -0,0 +1,37 @@
+import re
+import secrets
+from flask import g, request
+from werkzeug.exceptions import BadRequest
+
+SESSION_HEADER = 'X-Session-Id'
+SESSION_COOKIE = 'session_id'
+# How long the browser keeps an issued cart session
+SESSION_MAX_AGE = 60 * 60 * 24 * 30
+
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+def current_session_id():
+    """
+    The shopper owning the cart and wishlist this request works on: the X-Session-Id header,
+    else the session_id cookie, else a freshly issued id that init_app's hook sends back.
+    """
+    if 'session_id' not in g:
+        raw = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+        if raw is None:
+            g.session_id = secrets.token_urlsafe(24)
+            g.session_issued = True
+        elif _SESSION_ID.match(raw):
+            g.session_id = raw
+        else:
+            raise BadRequest("Session id must be 16-64 letters, digits, '-' or '_'")
+    return g.session_id
+
+
+def init_app(app):
+    @app.after_request
+    def issue_session(response):
+        if g.get('session_issued'):
+            response.set_cookie(SESSION_COOKIE, g.session_id, max_age=SESSION_MAX_AGE, httponly=True, samesite='Lax')
+            response.headers[SESSION_HEADER] = g.session_id
+        return response
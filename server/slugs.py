@@ -0,0 +1,42 @@
+import threading
+import changes
+
+# Past this many cached slugs the map starts over instead of growing without bound
+MAX_SLUGS = 100000
+
+
+class SlugMap:
+    """
+    In-process slug -> id map for `model`, filled on first lookup of each slug and emptied
+    by any commit that writes the model's table, so resolving a slug URL is a dict lookup.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._ids = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        changes.on_commit(self._on_commit)
+
+    def resolve(self, slug):
+        """Id of the row with this slug, or None."""
+        with self._lock:
+            if slug in self._ids:
+                return self._ids[slug]
+            generation = self._generation
+
+        row = self.model.query.with_entities(self.model.id).filter_by(slug=slug).first()
+        id = row.id if row else None
+        with self._lock:
+            # Only remember it if no write landed in the meantime
+            if generation == self._generation:
+                if len(self._ids) >= MAX_SLUGS:
+                    self._ids.clear()
+                self._ids[slug] = id
+        return id
+
+    def _on_commit(self, changed):
+        if self.model.__tablename__ in changed:
+            with self._lock:
+                self._generation += 1
+                self._ids.clear()
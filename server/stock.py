@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, bindparam
+from sqlalchemy.dialects.sqlite import insert
+from werkzeug.exceptions import Conflict
+from models import product_stock, stock_reservations
+
+# How long added-to-cart stock stays held for the shopper
+RESERVATION_TTL = timedelta(minutes=15)
+# Expired reservations released per sweeper transaction
+SWEEP_BATCH_SIZE = 500
+# Seconds between background sweeps
+SWEEP_INTERVAL = 30
+
+
+def reserve(session, session_id, product_id, quantity, now=None):
+    """
+    Hold `quantity` units of a product for a shopper's cart, in the session's transaction.
+    The stock check and decrement are one conditional UPDATE ... WHERE stock >= quantity, so
+    concurrent reservations of a hot product can't oversell and nothing is locked in Python.
+    Returns False for products that aren't stock-tracked; raises Conflict when short.
+    """
+    taken = session.execute(
+        update(product_stock)
+        .where(product_stock.c.product_id == product_id, product_stock.c.stock >= quantity)
+        .values(stock=product_stock.c.stock - quantity)
+    ).rowcount
+    if not taken:
+        # Only the failure path looks again, to tell "untracked" from "not enough"
+        available = session.execute(
+            select(product_stock.c.stock).where(product_stock.c.product_id == product_id)
+        ).scalar()
+        if available is None:
+            return False
+        raise Conflict(f"Only {available} left in stock")
+
+    _hold(session, session_id, {product_id: quantity}, now)
+    return True
+
+
+def reserve_many(session, session_id, quantities, now=None):
+    """
+    reserve() for several products at once, {product_id: quantity}: one IN query reads their
+    stock (skipping untracked products and naming every short one), then one executemany of
+    the same conditional UPDATE takes it. Raises Conflict when any product is short.
+    """
+    if not quantities:
+        return
+    available = dict(session.execute(
+        select(product_stock.c.product_id, product_stock.c.stock)
+        .where(product_stock.c.product_id.in_(quantities))
+    ).all())
+    tracked = {product_id: quantity for product_id, quantity in quantities.items() if product_id in available}
+    if not tracked:
+        return
+    short = sorted(product_id for product_id, quantity in tracked.items() if available[product_id] < quantity)
+    if short:
+        raise Conflict("Not enough stock for: " + ', '.join(f"product {product_id} ({available[product_id]} left)" for product_id in short))
+
+    taken = session.execute(
+        update(product_stock)
+        .where(product_stock.c.product_id == bindparam('reserved_product_id'),
+               product_stock.c.stock >= bindparam('reserved_quantity'))
+        .values(stock=product_stock.c.stock - bindparam('reserved_quantity')),
+        [{'reserved_product_id': product_id, 'reserved_quantity': quantity} for product_id, quantity in tracked.items()],
+    ).rowcount
+    if taken < len(tracked):
+        # Another shopper got there between the read and the update
+        raise Conflict("Stock changed while reserving, please retry")
+    _hold(session, session_id, tracked, now)
+
+
+def _hold(session, session_id, quantities, now=None):
+    # Add to the shopper's reservation of each product and push its expiry back
+    expires_at = (now or datetime.utcnow()) + RESERVATION_TTL
+    stmt = insert(stock_reservations)
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[stock_reservations.c.session_id, stock_reservations.c.product_id],
+            set_={'quantity': stock_reservations.c.quantity + stmt.excluded.quantity, 'expires_at': stmt.excluded.expires_at},
+        ),
+        [{'session_id': session_id, 'product_id': product_id, 'quantity': quantity, 'expires_at': expires_at}
+         for product_id, quantity in quantities.items()],
+    )
+
+
+def release(session, session_id, quantities=None):
+    """
+    Hand a shopper's held units back to stock, in the session's transaction: up to
+    {product_id: units} for removed or decreased cart lines, or everything they hold when
+    `quantities` is None (an emptied cart). Units whose reservation already expired were
+    returned by sweep() and aren't returned twice. Call it after the cart write, so the
+    transaction already holds SQLite's write lock and the sweeper can't release the same
+    rows between the read and the update.
+    """
+    reservations = select(stock_reservations.c.product_id, stock_reservations.c.quantity).where(
+        stock_reservations.c.session_id == session_id
+    )
+    if quantities is not None:
+        if not quantities:
+            return
+        reservations = reservations.where(stock_reservations.c.product_id.in_(quantities))
+    held = dict(session.execute(reservations).all())
+    released = {
+        product_id: quantity if quantities is None else min(quantity, quantities[product_id])
+        for product_id, quantity in held.items()
+    }
+    released = {product_id: quantity for product_id, quantity in released.items() if quantity > 0}
+    if not released:
+        return
+
+    emptied = [product_id for product_id, quantity in released.items() if quantity == held[product_id]]
+    if emptied:
+        session.execute(delete(stock_reservations).where(
+            stock_reservations.c.session_id == session_id, stock_reservations.c.product_id.in_(emptied),
+        ))
+    shrunk = [product_id for product_id in released if product_id not in emptied]
+    if shrunk:
+        session.execute(
+            update(stock_reservations)
+            .where(stock_reservations.c.session_id == session_id,
+                   stock_reservations.c.product_id == bindparam('released_product_id'))
+            .values(quantity=stock_reservations.c.quantity - bindparam('released_quantity')),
+            [{'released_product_id': product_id, 'released_quantity': released[product_id]} for product_id in shrunk],
+        )
+    _restock(session, released)
+
+
+def _restock(session, quantities):
+    # One executemany UPDATE adding {product_id: quantity} back to stock
+    session.execute(
+        update(product_stock)
+        .where(product_stock.c.product_id == bindparam('released_product_id'))
+        .values(stock=product_stock.c.stock + bindparam('released_quantity')),
+        [{'released_product_id': product_id, 'released_quantity': quantity} for product_id, quantity in quantities.items()],
+    )
+
+
+def sweep(session, now=None, batch_size=SWEEP_BATCH_SIZE):
+    """
+    Release expired reservations back to stock, `batch_size` at a time, one short transaction
+    per batch: a DELETE ... RETURNING picks and removes the batch in one statement (a renewal
+    racing it either lands first and is skipped, or re-creates the row afterwards) and one
+    executemany UPDATE hands the units back. Returns the number of reservations released.
+    """
+    now = now or datetime.utcnow()
+    expired = (
+        select(stock_reservations.c.id)
+        .where(stock_reservations.c.expires_at <= now)
+        .order_by(stock_reservations.c.expires_at)
+        .limit(batch_size)
+    )
+    released = 0
+    while True:
+        rows = session.execute(
+            delete(stock_reservations)
+            .where(stock_reservations.c.id.in_(expired))
+            .returning(stock_reservations.c.product_id, stock_reservations.c.quantity)
+        ).all()
+        if not rows:
+            session.rollback()
+            break
+        quantities = defaultdict(int)
+        for product_id, quantity in rows:
+            quantities[product_id] += quantity
+        _restock(session, quantities)
+        session.commit()
+        released += len(rows)
+        if len(rows) < batch_size:
+            break
+    return released
+
+
+def start_sweeper(app, session, interval=SWEEP_INTERVAL):
+    """Background thread running sweep() every `interval` seconds."""
+
+    def run():
+        while True:
+            with app.app_context():
+                try:
+                    sweep(session)
+                except Exception:
+                    session.rollback()
+                    app.logger.exception("Sweeping stock reservations failed")
+                finally:
+                    session.remove()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='stock-sweeper', daemon=True)
+    thread.start()
+    return thread
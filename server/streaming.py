@@ -0,0 +1,26 @@
+from flask import Response, stream_with_context
+
+# Rows fetched per query and encoded objects written per chunk
+STREAM_BATCH_SIZE = 500
+
+
+def stream_listing(key, pages, encode_page):
+    """
+    Chunked response carrying {"<key>": [...], "next_cursor": null}, written batch by batch
+    while `pages` (an iterator of row lists, see pagination.iter_pages) is consumed and each
+    page is turned into a list of JSON strings by `encode_page`. Only one batch of rows and
+    one chunk of JSON are alive at a time, so memory stays flat no matter how many rows
+    there are.
+    """
+
+    def generate():
+        yield f'{{"{key}": ['
+        separator = ''
+        for rows in pages:
+            encoded = encode_page(rows)
+            if encoded:
+                yield separator + ','.join(encoded)
+                separator = ','
+        yield '], "next_cursor": null}'
+
+    return Response(stream_with_context(generate()), status=200, mimetype='application/json')
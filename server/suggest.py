@@ -0,0 +1,145 @@
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from sqlalchemy import func
+import changes
+from models import Product, CartItem, WishlistItem
+
+# Cart/wishlist activity is folded into the ranking at most this often
+POPULARITY_TTL = 60
+
+
+def tokenize(text):
+    """Lowercase ASCII word tokens with accents stripped ("Héadphones Pro" -> ["headphones", "pro"])."""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+    return re.findall(r'[a-z0-9]+', text.lower())
+
+
+class PrefixIndex:
+    """
+    In-process autocomplete index over product names: a sorted array of (token, product id)
+    searched with bisect, ranked by cart + wishlist popularity.
+
+    Commits that write products only mark the touched ids; the next lookup re-reads just
+    those rows (one IN query) and patches the array in place. A full rebuild only happens
+    at startup and after bulk statements whose rows can't be known.
+    """
+
+    def __init__(self):
+        self._tokens = []
+        self._products = {}
+        self._popularity = {}
+        self._dirty = set()
+        self._needs_build = True
+        self._popularity_at = None
+        self._popularity_stale = False
+        self._lock = threading.Lock()
+        changes.on_commit(self._on_commit)
+
+    def _on_commit(self, changed):
+        with self._lock:
+            touched = changed.get('products', set())
+            if changes.ALL_ROWS in touched:
+                self._needs_build = True
+            else:
+                self._dirty.update(touched)
+            if 'cart_items' in changed or 'wishlist_items' in changed:
+                self._popularity_stale = True
+
+    def build(self, session):
+        """Load every product name; called at startup and whenever a bulk write made the index unreliable."""
+        # Cleared before reading, so commits landing during the build are applied afterwards
+        with self._lock:
+            self._needs_build = False
+            self._dirty.clear()
+        rows = session.query(Product.id, Product.name, Product.slug).all()
+        with self._lock:
+            self._products = {}
+            self._tokens = []
+            for row in rows:
+                self._products[row.id] = (row.name, row.slug, tokenize(row.name))
+                self._tokens.extend((token, row.id) for token in set(self._products[row.id][2]))
+            self._tokens.sort()
+        self._load_popularity(session)
+
+    def _load_popularity(self, session):
+        popularity = {}
+        for product_id, quantity in session.query(CartItem.product_id, func.sum(CartItem.quantity)).group_by(CartItem.product_id):
+            popularity[product_id] = popularity.get(product_id, 0) + (quantity or 0)
+        for product_id, count in session.query(WishlistItem.product_id, func.count()).group_by(WishlistItem.product_id):
+            popularity[product_id] = popularity.get(product_id, 0) + count
+        with self._lock:
+            self._popularity = popularity
+            self._popularity_at = time.monotonic()
+            self._popularity_stale = False
+
+    def _refresh(self, session):
+        with self._lock:
+            needs_build = self._needs_build
+            dirty, self._dirty = self._dirty, set()
+            popularity_due = self._popularity_at is None or (
+                self._popularity_stale and time.monotonic() - self._popularity_at > POPULARITY_TTL
+            )
+        if needs_build:
+            return self.build(session)
+
+        if dirty:
+            rows = session.query(Product.id, Product.name, Product.slug).filter(Product.id.in_(dirty)).all()
+            with self._lock:
+                for product_id in dirty:
+                    self._remove(product_id)
+                for row in rows:
+                    tokens = tokenize(row.name)
+                    self._products[row.id] = (row.name, row.slug, tokens)
+                    for token in set(tokens):
+                        insort(self._tokens, (token, row.id))
+        if popularity_due:
+            self._load_popularity(session)
+
+    def _remove(self, product_id):
+        entry = self._products.pop(product_id, None)
+        if entry is None:
+            return
+        for token in set(entry[2]):
+            position = bisect_left(self._tokens, (token, product_id))
+            if position < len(self._tokens) and self._tokens[position] == (token, product_id):
+                del self._tokens[position]
+
+    def _prefix_range(self, prefix):
+        # Every (token, id) whose token starts with prefix sits between these two positions
+        start = bisect_left(self._tokens, (prefix,))
+        end = bisect_left(self._tokens, (prefix[:-1] + chr(ord(prefix[-1]) + 1),))
+        return start, end
+
+    def suggest(self, session, text, limit=10):
+        """Top `limit` products whose name has a word starting with each word of `text` (the last as a prefix)."""
+        self._refresh(session)
+        words = tokenize(text)
+        if not words:
+            return []
+        with self._lock:
+            candidates = None
+            for position, word in enumerate(words):
+                if position < len(words) - 1:
+                    start = bisect_left(self._tokens, (word,))
+                    end = bisect_left(self._tokens, (word, float('inf')))
+                else:
+                    start, end = self._prefix_range(word)
+                ids = {product_id for _, product_id in self._tokens[start:end]}
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    return []
+            best = heapq.nsmallest(
+                limit, candidates,
+                key=lambda product_id: (-self._popularity.get(product_id, 0), self._products[product_id][0].lower(), product_id),
+            )
+            return [
+                {"id": product_id, "name": self._products[product_id][0], "slug": self._products[product_id][1]}
+                for product_id in best
+            ]
+
+
+suggest_index = PrefixIndex()